@@ -0,0 +1,186 @@
+"""SRUN encryption micro-benchmark
+
+Measures time and memory of get_xencode, get_base64, get_md5 and get_sha1. Outputs are
+checked against golden vectors of the reference implementation before timing.
+
+    python -m encryption.benchmark --save baseline.json
+    python -m encryption.benchmark --compare baseline.json
+"""
+
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from encryption.srun_hash import get_md5, get_sha1
+from encryption.srun_base64 import get_base64
+from encryption.srun_xencode import get_xencode
+
+GOLDEN_VECTORS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden_vectors.json')
+
+TOKEN = '711ab370231392679fe06523b119a8fe096f5ed9bd206b4de8d7b5b994bbc3e5'
+USERNAME = '201626203044@cmcc'
+PASSWORD = '15879684798qq'
+IP = '10.128.96.249'
+SIZES = [16, 256, 4096]
+
+class BenchmarkCase(NamedTuple):
+    name: str
+    func: Callable
+    args: Tuple
+    payload_size: int
+
+def make_session():
+    from srun_auth import SrAuthSession
+    return SrAuthSession('gw.buaa.edu.cn', 1, 200, 68)
+
+def make_payload(size: int, seed: int) -> str:
+    """Printable payload of {size} characters"""
+    rnd = random.Random(seed)
+    return ''.join(chr(rnd.randint(0x20, 0x7e)) for _ in range(size))
+
+def make_binary_payload(size: int, seed: int) -> str:
+    """Payload of {size} characters in 0-255, like get_xencode output"""
+    rnd = random.Random(seed)
+    return ''.join(chr(rnd.randint(0, 255)) for _ in range(size))
+
+def make_cases() -> List[BenchmarkCase]:
+    session = make_session()
+    info = session.get_info(IP, USERNAME, PASSWORD)
+    xencoded = get_xencode(info, TOKEN)
+    hmd5 = get_md5(PASSWORD, TOKEN)
+    chksum_input = session.get_chksum(hmd5, IP, TOKEN, USERNAME, '{SRBX1}' + get_base64(xencoded))
+
+    cases = [
+        BenchmarkCase('xencode/info', get_xencode, (info, TOKEN), len(info)),
+        BenchmarkCase('base64/info', get_base64, (xencoded,), len(xencoded)),
+        BenchmarkCase('md5/password', get_md5, (PASSWORD, TOKEN), len(PASSWORD)),
+        BenchmarkCase('sha1/chksum', get_sha1, (chksum_input,), len(chksum_input)),
+    ]
+
+    for size in SIZES:
+        cases.append(BenchmarkCase(f'xencode/{size}', get_xencode, (make_payload(size, size), TOKEN), size))
+        cases.append(BenchmarkCase(f'base64/{size}', get_base64, (make_binary_payload(size, size),), size))
+        cases.append(BenchmarkCase(f'md5/{size}', get_md5, (make_payload(size, size), TOKEN), size))
+        cases.append(BenchmarkCase(f'sha1/{size}', get_sha1, (make_payload(size, size),), size))
+
+    return cases
+
+def generate_golden_vectors(cases: List[BenchmarkCase]) -> Dict[str, Dict[str, object]]:
+    return {i.name: {'args': list(i.args), 'output': i.func(*i.args)} for i in cases}
+
+def check_golden_vectors(cases: List[BenchmarkCase], path: os.PathLike) -> List[str]:
+    """Return names of cases whose output differs from the golden vectors"""
+    with open(path, 'r') as f:
+        golden = json.load(f)
+
+    mismatches = []
+    for i in cases:
+        vector = golden.get(i.name)
+        if vector is None:
+            continue
+        if i.func(*vector['args']) != vector['output']:
+            mismatches.append(i.name)
+    return mismatches
+
+def time_case(case: BenchmarkCase, repeat: int, min_time_sec: float) -> Dict[str, float]:
+    # Find a loop count running at least {min_time_sec}
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            case.func(*case.args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time_sec:
+            break
+        loops *= 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            case.func(*case.args)
+        samples.append((time.perf_counter() - start) / loops)
+
+    tracemalloc.start()
+    case.func(*case.args)
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    case.func(*case.args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(samples)
+    return {
+        'ns_per_call': best * 1e9,
+        'median_ns_per_call': statistics.median(samples) * 1e9,
+        'mb_per_sec': case.payload_size / best / 1e6,
+        'peak_alloc_bytes': peak - base
+    }
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Return descriptions of cases slower than {threshold} times the baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['ns_per_call'] / baseline[name]['ns_per_call']
+        if ratio > threshold:
+            regressions.append(f'{name}: {ratio:.2f}x slower than baseline')
+    return regressions
+
+if __name__ == '__main__':
+    parser = ArgumentParser("SRUN encryption micro-benchmark")
+    parser.add_argument('--repeat', type=int, default=5, help='Timing samples per case. Default 5')
+    parser.add_argument('--min-time', type=float, default=0.05, help='Minimal duration of a sample in seconds. Default 0.05')
+    parser.add_argument('--save', type=str, default=None, help='Write results as baseline file')
+    parser.add_argument('--compare', type=str, default=None, help='Compare with baseline file, exit 1 on regression')
+    parser.add_argument('--threshold', type=float, default=1.3, help='Slowdown ratio flagged as regression. Default 1.3')
+    parser.add_argument('--update-golden', action='store_true', default=False, help='Regenerate golden vectors from current implementation')
+
+    args = parser.parse_args(sys.argv[1:])
+    cases = make_cases()
+
+    if args.update_golden:
+        with open(GOLDEN_VECTORS_PATH, 'w') as f:
+            json.dump(generate_golden_vectors(cases), f, indent=4)
+        print(f'Golden vectors written to {GOLDEN_VECTORS_PATH}')
+        exit(0)
+
+    mismatches = check_golden_vectors(cases, GOLDEN_VECTORS_PATH)
+    if len(mismatches) != 0:
+        print(f'Output differs from golden vectors: {", ".join(mismatches)}')
+        exit(1)
+
+    results = {}
+    for i in cases:
+        results[i.name] = time_case(i, args.repeat, args.min_time)
+        r = results[i.name]
+        print(f"{i.name:<16} {r['ns_per_call']:>14.0f} ns/call {r['mb_per_sec']:>10.3f} MB/s {r['peak_alloc_bytes']:>10} B peak")
+
+    report = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'results': results
+    }
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline['results'], args.threshold)
+        for i in regressions:
+            print(f'REGRESSION {i}')
+        if len(regressions) != 0:
+            exit(1)
@@ -26,7 +26,6 @@ def get_base64(s):
         x.append(ALPHA[((b10 >> 6) & 63)])
         x.append(ALPHA[(b10 & 63)])
     i=imax
-    print(i, len(s))
     if len(s) - imax ==1:
         b10 = getbyte(s, i) << 16
         x.append(ALPHA[(b10 >> 18)] + ALPHA[((b10 >> 12) & 63)] + PAD_CHAR + PAD_CHAR)
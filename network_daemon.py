@@ -1,41 +1,59 @@
 from argparse import ArgumentParser
+from collections import deque
 import functools
 import grp
 import json
 import os
 import signal
+import socket
 import sys
 import time
-from typing import Callable, List, NamedTuple, Tuple
+from typing import Callable, Deque, Dict, List, NamedTuple, Tuple
 
-from daemon import DaemonContext
-import lockfile
-from network_detect import check_network_access
-from srun_auth import srun_auth_recover
-from wpa_helpers import wpa_recover_open, get_local_ip
-from cf_helper import update_local_ip
+# Helpers pull in requests, netifaces and the Cloudflare SDK. They are imported
+# where they are used, so CLI and startup do not pay for them
 
 class DaemonConfiguration(NamedTuple):
     check_interval_sec: float = 60 # Time interval for detecting network conditions
+    adaptive_check_interval: bool = True # Adapt check interval to probe history between {check_interval_min_sec} and {check_interval_max_sec}
+    check_interval_min_sec: float = 5 # Interval after a recovery, in flaky hours or while probe latency trends up
+    check_interval_max_sec: float = 300 # Upper bound of interval on a stable link
+    check_history_size: int = 20 # Number of probes in rolling window of outcomes and latencies
+    check_backoff_factor: float = 2 # Interval growth per {check_history_size} base intervals without failure
+    check_recover_watch_sec: float = 600 # Use {check_interval_min_sec} for this long after a recovery
+    check_latency_trend_ratio: float = 1.5 # Latency trends up if newer half of window is slower than older half by this ratio
+    flaky_hours: Tuple[int, ...] = () # Local hours (0-23) with frequent outages, checked every {check_interval_min_sec}
     inet_check_url: str = 'http://www.qq.com/'  # Test website for detecting network
     gw_check_url: str =  'https://gw.buaa.edu.cn/' # Test address for checking availability of SRUN gateway
+    probe_family: str = 'ipv4' # Address family of network checks: ipv4, ipv6, any, or dual for concurrent IPv6/IPv4 probes
     fix_attempts: int = 5 # number of attempts to try to recover network
+    max_pending_actions: int = 64 # Upper bound of scheduled actions. Further actions are dropped
     fix_retry_interval_sec: float = 6 # Interval for attempts
     infinity_retry_interval_sec: float = 3600 # if all {fix_attempts} attempts fail, retry in {infinity_retry_interval_sec} seconds
     wpa_ctrl_interface: str = '/var/run/wpa_supplicant/' # wpa control interface
     interface_name: str = 'wlp68s0' # wifi adapter name
     ssid: str = 'BUAA-WiFi' # ssid
+    dhcp_renew: bool = True # Renew DHCP lease with dhclient after WiFi link is re-established
     gw_server: str =  'gw.buaa.edu.cn' # SRUN gateway
+    gw_protocol: str = 'https' # Protocol for accessing SRUN gateway
     username: str = None # username for SRUN auth
     password: str = None # password for SRUN auth
     auth_n: int = 200 # SRUN internal parameter
     auth_n_type: int = 1 # SRUN internal parameter
     auth_acid: int = 68 # SRUN internal parameter
+    auth_double_stack: bool = False # Ask SRUN gateway to authorize IPv6 together with IPv4
+    auth_check_interval_sec: float = 1 # Interval between SRUN state checks after login
+    auth_logout_wait_sec: float = 3 # Wait after logout before login again
     cf_api_token: str = None # Cloudflare Token for accessing KV storage
     cf_api_key: str = None # Cloudflare Key
     cf_api_email:str = None
+    cf_api_base_url: str = None # Cloudflare API endpoint. Default official endpoint
+    publish_ipv6: bool = False # Also upload global IPv6 address to Cloudflare KV key 'ip6'
     cf_retry_interval_sec: float = 600 # if Cloudflare KV access fails, retry in {cf_retry_interval_sec} seconds
 
+# Keys of network_detect.ADDRESS_FAMILIES, kept here so loading a config does not import requests
+PROBE_FAMILIES = ('ipv4', 'ipv6', 'any', 'dual')
+
 class DaemonConfigurationHelpers:
     @staticmethod
     def load_config(path: os.PathLike) -> DaemonConfiguration:
@@ -52,23 +70,159 @@ class DaemonConfigurationHelpers:
 
         os.chmod(path, 777)
 
+class DaemonState(NamedTuple):
+    last_ip: str | None = None # Last LAN IP observed while the internet was reachable
+    last_published_ip: str | None = None # Last IP successfully uploaded to Cloudflare KV
+    last_ipv6: str | None = None # Last global IPv6 address observed
+    last_published_ipv6: str | None = None # Last IPv6 address successfully uploaded to Cloudflare KV
+    last_published_time: float = 0 # Timestamp of last successful upload
+    wpa_network_id: int | None = None # wpa_supplicant network id configured for {ssid}
+    last_login_time: float = 0 # Timestamp of last successful SRUN login
+    last_gw_state: str | None = None # Gateway state observed during last recovery
+    last_recover_time: float = 0 # Timestamp of last successful recovery
+    recover_count: int = 0 # Number of successful recoveries
+
+class DaemonStateHelpers:
+    @staticmethod
+    def load_state(path: os.PathLike) -> DaemonState:
+        try:
+            with open(path, 'r') as f:
+                dict_value = json.load(f)
+        except (OSError, ValueError):
+            return DaemonState()
+
+        if not isinstance(dict_value, dict):
+            return DaemonState()
+
+        return DaemonState(**{k: v for k, v in dict_value.items() if k in DaemonState._fields})
+
+    @staticmethod
+    def store_state(path: os.PathLike, state: DaemonState) -> None:
+        # Write to a temporary file and rename it over the old state, so that a crash
+        # never leaves a truncated state file behind.
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state._asdict(), f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class ProbeRecord(NamedTuple):
+    time: float
+    success: bool
+    latency_sec: float
+
+class ProbeCadence:
+    """Interval between internet checks adapted to a rolling window of probe outcomes"""
+    def __init__(self, history_size: int):
+        self.history: Deque[ProbeRecord] = deque(maxlen=max(1, history_size))
+        self.healthy_since: float | None = None # Time of first successful probe after last failure
+
+    def record_probe(self, config: DaemonConfiguration, success: bool, latency_sec: float, now: float) -> None:
+        if self.history.maxlen != max(1, config.check_history_size):
+            self.history = deque(self.history, maxlen=max(1, config.check_history_size))
+
+        self.history.append(ProbeRecord(now, success, latency_sec))
+        if not success:
+            self.healthy_since = None
+        elif self.healthy_since is None:
+            self.healthy_since = now
+
+    def latency_trending_up(self, config: DaemonConfiguration) -> bool:
+        latencies = [i.latency_sec for i in self.history if i.success]
+        if len(latencies) < 8:
+            return False
+
+        half = len(latencies) // 2
+        older = sum(latencies[:half]) / half
+        newer = sum(latencies[-half:]) / half
+        # Ignore jitter of fast probes
+        return newer > older * config.check_latency_trend_ratio and newer - older > 0.05
+
+    def next_interval(self, config: DaemonConfiguration, now: float, last_recover_time: float) -> Tuple[float, str]:
+        """Return seconds until next check and the reason"""
+        base = config.check_interval_sec
+        if not config.adaptive_check_interval:
+            return base, 'fixed'
+
+        tight = min(base, config.check_interval_min_sec)
+        if now - last_recover_time < config.check_recover_watch_sec:
+            return tight, 'recent recovery'
+        if time.localtime(now).tm_hour in config.flaky_hours:
+            return tight, 'flaky hour'
+        if self.latency_trending_up(config):
+            return tight, 'latency trending up'
+
+        # Stability is measured in time, so tight checks after a recovery do not count as more evidence
+        healthy_since = max(self.healthy_since or now, last_recover_time)
+        stable_windows = int((now - healthy_since) // (base * max(1, config.check_history_size)))
+        if stable_windows <= 0:
+            return base, 'base'
+        backoff = base * config.check_backoff_factor ** min(stable_windows, 64)
+        return max(base, min(config.check_interval_max_sec, backoff)), 'stable'
+
+def action_key(action: Callable[[], None]) -> Tuple[Callable, tuple, tuple]:
+    """Identity of an action. Partials with equal function and arguments are the same action"""
+    if isinstance(action, functools.partial):
+        return (action.func, action.args, tuple(sorted(action.keywords.items())))
+    return (action, (), ())
 
 class NetworkDaemon:
-    def __init__(self, config_path: os.PathLike | None = None):
+    def __init__(self, config_path: os.PathLike | None = None, state_path: os.PathLike | None = None):
         if config_path is None:
             config_path = "./default_cfg.json"
             DaemonConfigurationHelpers.store_config(config_path, DaemonConfiguration())
 
         self.config_path = config_path
+        self.state_path = state_path
         self.action_queue: List[Tuple[float, Callable[[],None]]] = []
         self.loop_run = True
         
         self.update_config()
+        self.state = DaemonState() if state_path is None else DaemonStateHelpers.load_state(state_path)
+        self.family_verdicts: Dict[str, str] = {} # Verdicts per address family of last dual-stack probe
+        self.cadence = ProbeCadence(self.config.check_history_size)
+        self.check_interval: float | None = None # Interval chosen after last successful check
 
     def update_config(self) -> None:
-        self.config = DaemonConfigurationHelpers.load_config(self.config_path)
+        config = DaemonConfigurationHelpers.load_config(self.config_path)
+        if config.probe_family not in PROBE_FAMILIES:
+            print(f"Unknown probe_family {config.probe_family!r}, expected one of {', '.join(PROBE_FAMILIES)}. Use 'ipv4'")
+            config = config._replace(probe_family = 'ipv4')
+        self.config = config
     
+    def update_state(self, **changes) -> None:
+        new_state = self.state._replace(**changes)
+        if new_state == self.state:
+            return
+
+        self.state = new_state
+        if self.state_path is not None:
+            try:
+                DaemonStateHelpers.store_state(self.state_path, self.state)
+            except OSError as e:
+                print(f"Unable to store daemon state to {self.state_path}: {e}")
+
     def apply_action(self, time: float, action: Callable[[], None]) -> None:
+        # An identical action already pending runs at the earlier of both times
+        key = action_key(action)
+        for i, (pending_time, pending_action) in enumerate(self.action_queue):
+            if action_key(pending_action) == key:
+                self.action_queue[i] = (min(time, pending_time), pending_action)
+                return
+
+        if len(self.action_queue) >= self.config.max_pending_actions:
+            print(f"Action queue full ({len(self.action_queue)} pending). Drop action {key[0].__name__}")
+            return
+
         self.action_queue.append((time, action))
 
     def daemon_stop(self) -> None:
@@ -79,24 +233,72 @@ class NetworkDaemon:
             current_time = time.time()
             due_tasks = [i for i in self.action_queue if i[0] <= current_time]
 
-            
+            if len(due_tasks) != 0:
+                self.action_queue = [i for i in self.action_queue if i[0] > current_time]
 
             for i in due_tasks:
-                self.action_queue.remove(i)
                 i[1]()
 
             time.sleep(0.05)
         
         print('Daemon exit gracefully.')
 
+    def check_network_access(self, url: str) -> str:
+        from network_detect import ADDRESS_FAMILIES, check_network_access, check_network_access_dual_stack
+
+        if self.config.probe_family == 'dual':
+            verdict, self.family_verdicts = check_network_access_dual_stack(url)
+            return verdict
+
+        return check_network_access(url, family = ADDRESS_FAMILIES[self.config.probe_family])
+
     def action_update_new_ip(self) -> None:
+        from cf_helper import update_local_ip
+        from wpa_helpers import get_local_ip
+
         ip = get_local_ip(self.config.interface_name)
-        if update_local_ip(self.config.cf_api_email, self.config.cf_api_token, self.config.cf_api_key, ip):
-            print(f"Uploaded IP to Cloudflare KV. New IP = {ip}")
-        else:
-            self.apply_action(time.time() + self.config.cf_retry_interval_sec, self.action_update_new_ip)
+        # Collected and stored once, every store costs fsyncs
+        changes: Dict[str, object] = {'last_ip': ip}
+        # (KV key, address, state field of last published address)
+        targets = [('ip', ip, 'last_published_ip')]
+
+        if self.config.publish_ipv6:
+            ipv6 = get_local_ip(self.config.interface_name, socket.AF_INET6)
+            changes['last_ipv6'] = ipv6
+            targets.append(('ip6', ipv6, 'last_published_ipv6'))
+
+        # '<None>' means the interface has no such address. Keep the last published one
+        pending = [i for i in targets if i[1] != '<None>' and i[1] != getattr(self.state, i[2])]
+        for key, value, field in targets:
+            if value == '<None>':
+                print(f"No address for key {key} on {self.config.interface_name}. Keep last published IP = {getattr(self.state, field)}")
+
+        if len(pending) == 0:
+            if ip != '<None>':
+                print(f"IP unchanged since last upload. Skip Cloudflare KV update. IP = {ip}")
+            self.update_state(**changes)
+            return
+
+        for key, value, field in pending:
+            if not update_local_ip(
+                    self.config.cf_api_email,
+                    self.config.cf_api_token,
+                    self.config.cf_api_key,
+                    value,
+                    base_url = self.config.cf_api_base_url,
+                    key = key):
+                self.apply_action(time.time() + self.config.cf_retry_interval_sec, self.action_update_new_ip)
+                break
+
+            print(f"Uploaded IP to Cloudflare KV. Key = {key}, new IP = {value}")
+            changes.update({field: value, 'last_published_time': time.time()})
+
+        self.update_state(**changes)
 
     def action_try_fix_inet(self, remain_attempts: int) -> None:
+        from srun_auth import srun_auth_recover
+        from wpa_helpers import wpa_recover_open
+
         if remain_attempts == 0:
             print(f"Remain attempts = 0. Retry in {self.config.infinity_retry_interval_sec} seconds")
             self.apply_action(
@@ -107,24 +309,30 @@ class NetworkDaemon:
             return
         
         print(f"INET recover attempt = {remain_attempts}. Start diagnosing issues.")
+        # Collected and stored once, every store costs fsyncs
+        changes: Dict[str, object] = {}
 
         print(f"Check availability of SRUN gateway server {self.config.gw_check_url}")
 
-        gw_state = check_network_access(self.config.gw_check_url)
+        gw_state = self.check_network_access(self.config.gw_check_url)
 
         print(f"Gateway server access = {gw_state}")
 
         if gw_state == 'NoAccess':
             print("Try to re-establish WiFi link")
 
-            success = wpa_recover_open(
+            success, network_id = wpa_recover_open(
                 self.config.wpa_ctrl_interface,
                 self.config.interface_name,
-                self.config.ssid
+                self.config.ssid,
+                network_id = self.state.wpa_network_id,
+                dhcp_renew = self.config.dhcp_renew
             )
 
+            changes['wpa_network_id'] = network_id
+
             if success:
-                if check_network_access(self.config.gw_check_url) == 'FullAccess':
+                if self.check_network_access(self.config.gw_check_url) == 'FullAccess':
                     print("WiFi connection issue solved.")
                     gw_state = 'FullAccess'
 
@@ -138,26 +346,40 @@ class NetworkDaemon:
                 self.config.auth_n,
                 self.config.auth_acid,
                 self.config.username,
-                self.config.password
+                self.config.password,
+                attempt_interval = self.config.auth_check_interval_sec,
+                protocol = self.config.gw_protocol,
+                double_stack = self.config.auth_double_stack,
+                logout_wait = self.config.auth_logout_wait_sec
             )
 
             if success:
-                if check_network_access(self.config.inet_check_url) == 'FullAccess':
+                changes['last_login_time'] = time.time()
+
+                if self.check_network_access(self.config.inet_check_url) == 'FullAccess':
                     print("Auth issue solved. Inet connection recovered !!")
+                    self.update_state(
+                        **changes,
+                        last_gw_state = gw_state,
+                        last_recover_time = time.time(),
+                        recover_count = self.state.recover_count + 1)
                     self.apply_action(time.time(), functools.partial(self.action_check_inet, from_recover = True))
                     return
                 
+        self.update_state(**changes)
         print(f"Failed at GW state {gw_state}. Retry in {self.config.fix_retry_interval_sec} seconds")
         self.apply_action(
             time.time() + self.config.fix_retry_interval_sec, 
             functools.partial(
                 self.action_try_fix_inet, 
-                remain_attempts = self.config.fix_attempts - 1))
+                remain_attempts = remain_attempts - 1))
         return
             
 
     def action_check_inet(self, from_recover: bool = False) -> None:
-        inet_status = check_network_access(self.config.inet_check_url)
+        probe_start = time.monotonic()
+        inet_status = self.check_network_access(self.config.inet_check_url)
+        self.cadence.record_probe(self.config, inet_status == 'FullAccess', time.monotonic() - probe_start, time.time())
 
         if inet_status == 'FullAccess':
             # print(f"Internet access successful. Test server = {self.config.inet_check_url}")
@@ -165,9 +387,16 @@ class NetworkDaemon:
             if from_recover:
                 self.apply_action(time.time(), self.action_update_new_ip)
 
-            self.apply_action(time.time() + self.config.check_interval_sec, self.action_check_inet)
+            interval, reason = self.cadence.next_interval(self.config, time.time(), self.state.last_recover_time)
+            if interval != self.check_interval:
+                print(f"Check internet access every {interval:g} seconds ({reason})")
+                self.check_interval = interval
+
+            self.apply_action(time.time() + interval, self.action_check_inet)
         else:
             print("Internet access failed. Try recover.")
+            if self.config.probe_family == 'dual':
+                print(f"Verdicts per address family = {self.family_verdicts}")
             self.apply_action(
                 time.time(), 
                 functools.partial(
@@ -181,6 +410,9 @@ def ctrl_daemon_stop(signum, frame, daemon: NetworkDaemon | None= None):
     daemon.daemon_stop()
 
 def run_daemon(config_path: os.PathLike, work_dir: os.PathLike = '/var/lib/bnaod'):
+    from daemon import DaemonContext
+    import lockfile
+
     if not os.path.exists(work_dir):
         os.makedirs(work_dir)
 
@@ -189,7 +421,7 @@ def run_daemon(config_path: os.PathLike, work_dir: os.PathLike = '/var/lib/bnaod
             os.makedirs(os.path.dirname(config_path))
         DaemonConfigurationHelpers.store_config(config_path, DaemonConfiguration())
 
-    daemon = NetworkDaemon(config_path)
+    daemon = NetworkDaemon(config_path, os.path.join(os.path.abspath(work_dir), 'state.json'))
         
     context = DaemonContext(
         working_directory=work_dir,
@@ -209,6 +441,8 @@ def run_daemon(config_path: os.PathLike, work_dir: os.PathLike = '/var/lib/bnaod
 
     with context:
         print(f"Network daemon started. Using configuration file = {config_path}")
+        if daemon.state.last_published_ip is not None:
+            print(f"Restored daemon state. Last published IP = {daemon.state.last_published_ip}")
 
         daemon.apply_action(time.time(), functools.partial(daemon.action_check_inet, from_recover = True))
         daemon.daemon_loop()
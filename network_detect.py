@@ -1,38 +1,111 @@
-
+import queue
 import socket
-from typing import Callable
+import threading
+from typing import Callable, Dict, Tuple
 import requests
 
 from requests.adapters import HTTPAdapter, Retry
 
-import urllib3.util.connection as urllib3_cn 
-from urllib3.connectionpool import HTTPConnectionPool
-   
-def allowed_gai_family():
-    return socket.AF_INET
+ADDRESS_FAMILIES = {
+    'ipv4': socket.AF_INET,
+    'ipv6': socket.AF_INET6,
+    'any': socket.AF_UNSPEC,
+    'dual': None # Concurrent IPv6 and IPv4 probes, see check_network_access_dual_stack
+}
+
+FAMILY_NAMES = {
+    socket.AF_INET: 'ipv4',
+    socket.AF_INET6: 'ipv6'
+}
+
+VERDICT_RANK = ['NoAccess', 'NoAuth', 'FullAccess']
+
+FAMILY_SOURCE_ADDRESS = {
+    socket.AF_INET: ('0.0.0.0', 0),
+    socket.AF_INET6: ('::', 0)
+}
+
+class AddressFamilyAdapter(HTTPAdapter):
+    """HTTP adapter which only connects over {family}.
+
+    Sockets are bound to the wildcard address of {family}, so connecting to a resolved
+    address of another family fails locally and urllib3 moves on to the next address."""
+    def __init__(self, family: socket.AddressFamily = socket.AF_INET, **kwargs):
+        self.family = family
+        super().__init__(**kwargs)
 
-urllib3_cn.allowed_gai_family = allowed_gai_family
+    def init_poolmanager(self, *args, **kwargs):
+        if self.family in FAMILY_SOURCE_ADDRESS:
+            kwargs['source_address'] = FAMILY_SOURCE_ADDRESS[self.family]
+        super().init_poolmanager(*args, **kwargs)
+
+def create_session(family: socket.AddressFamily = socket.AF_INET, retry: Retry | int = 0) -> requests.Session:
+    s = requests.Session()
+    adapter = AddressFamilyAdapter(family, max_retries=retry)
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    return s
 
 def srun_network_check(content: str) -> str:
     if 'https://gw.buaa.edu.cn/' in content:
         return 'NoAuth'
-    
+
     return 'FullAccess'
 
-def check_network_access(url: str, auth_check: Callable[[str], str] = srun_network_check, timeout: float = 2, retry: int = 3) -> str:
-    s = requests.Session()
+def check_network_access(
+        url: str,
+        auth_check: Callable[[str], str] = srun_network_check,
+        timeout: float = 2,
+        retry: int = 3,
+        family: socket.AddressFamily = socket.AF_INET) -> str:
     retries = Retry(total=retry, backoff_factor=0.1, status_forcelist=[ 500, 502, 503, 504 ])
-    s.mount('http://', HTTPAdapter(max_retries=retries))
 
     try:
-        response = s.get(url, timeout = timeout)
-        return auth_check(response.text)
+        with create_session(family, retries) as s:
+            response = s.get(url, timeout = timeout)
+            return auth_check(response.text)
     except requests.ConnectTimeout as timeout:
         return 'NoAccess'
     except requests.exceptions.ConnectionError as ce:
         return 'NoAccess'
+    except requests.RequestException as e: # Read timeout, too many retries
+        return 'NoAccess'
     return 'NoAccess'
-    
-    
+
+def check_network_access_dual_stack(
+        url: str,
+        auth_check: Callable[[str], str] = srun_network_check,
+        timeout: float = 2,
+        retry: int = 3,
+        attempt_delay: float = 0.25) -> Tuple[str, Dict[str, str]]:
+    """Probe {url} over IPv6 and IPv4 concurrently, Happy Eyeballs style.
+
+    IPv6 starts first and IPv4 follows after {attempt_delay} unless IPv6 already got
+    through. Returns as soon as one family has full access, with the best verdict and
+    the verdicts of the families that answered so far."""
+    results: queue.Queue[Tuple[socket.AddressFamily, str]] = queue.Queue()
+
+    def probe(family: socket.AddressFamily) -> None:
+        results.put((family, check_network_access(url, auth_check, timeout, retry, family)))
+
+    threading.Thread(target=probe, args=(socket.AF_INET6,), daemon=True).start()
+
+    verdicts: Dict[str, str] = {}
+    try:
+        family, verdict = results.get(timeout=attempt_delay)
+        verdicts[FAMILY_NAMES[family]] = verdict
+    except queue.Empty:
+        pass
+
+    if verdicts.get('ipv6') != 'FullAccess':
+        threading.Thread(target=probe, args=(socket.AF_INET,), daemon=True).start()
+
+        while len(verdicts) < 2 and 'FullAccess' not in verdicts.values():
+            family, verdict = results.get()
+            verdicts[FAMILY_NAMES[family]] = verdict
+
+    return max(verdicts.values(), key=VERDICT_RANK.index), verdicts
+
+
 if __name__=="__main__":
     print(check_network_access('http://www.baidu.com/'))
@@ -0,0 +1,151 @@
+"""Local stand-in for the Cloudflare v4 API subset used by cf_helper"""
+
+import json
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from simulation.faults import FaultInjector, FaultScenario
+
+class FakeKVHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def answer(self, status: int, result: object, result_info: Dict[str, int] | None = None):
+        body = {'success': status == 200, 'errors': [], 'messages': [], 'result': result}
+        if status != 200:
+            body['errors'] = [{'code': status, 'message': 'simulated error'}]
+        if result_info is not None:
+            body['result_info'] = result_info
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def answer_list(self, items: List[object]):
+        self.answer(200, items, {'page': 1, 'per_page': 20, 'count': len(items), 'total_count': len(items)})
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length)
+
+    def route(self, method: str):
+        injector: FaultInjector = self.server.injector
+        body = self.read_body() if method == 'PUT' else b''
+
+        if injector.should_drop():
+            self.close_connection = True
+            return
+
+        injector.delay()
+
+        kv: FakeCloudflareKV = self.server.owner
+        parts = [i for i in urlsplit(self.path).path.split('/') if i != '']
+        # Strip /client/v4 prefix when present
+        if parts[:2] == ['client', 'v4']:
+            parts = parts[2:]
+
+        if not kv.authorized(self.headers):
+            self.answer(403, None)
+            return
+
+        if method == 'GET' and parts == ['accounts']:
+            self.answer_list([{'id': kv.account_id, 'name': 'Simulated account'}])
+            return
+
+        if len(parts) >= 5 and parts[0] == 'accounts' and parts[1] == kv.account_id and parts[2:4] == ['storage', 'kv']:
+            if method == 'GET' and parts[4:] == ['namespaces']:
+                self.answer_list([{'id': id, 'title': title} for title, id in kv.namespaces.items()])
+                return
+
+            if method == 'PUT' and len(parts) == 8 and parts[4] == 'namespaces' and parts[6] == 'values':
+                if parts[5] not in kv.namespaces.values():
+                    self.answer(404, None)
+                    return
+
+                kv.put(parts[5], parts[7], kv.decode_value(self.headers.get('Content-Type', ''), body))
+                self.answer(200, {})
+                return
+
+        self.answer(404, None)
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_PUT(self):
+        self.route('PUT')
+
+class FakeCloudflareKV:
+    """Serve accounts, KV namespace listing and KV value update with fault injection"""
+    def __init__(self,
+            api_token: str | None = None,
+            account_id: str = 'sim-account',
+            namespaces: Dict[str, str] = {'xn-ip': 'sim-namespace'},
+            port: int = 0,
+            scenario: FaultScenario = FaultScenario(),
+            seed: int | None = None):
+        self.api_token = api_token
+        self.account_id = account_id
+        self.namespaces = dict(namespaces) # title -> id
+        self.values: Dict[Tuple[str, str], str] = {}
+        self.update_count = 0
+        self.lock = threading.Lock()
+        self.injector = FaultInjector(scenario, seed)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), FakeKVHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.injector = self.injector
+        self.httpd.owner = self
+        self.thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}/client/v4'
+
+    def authorized(self, headers) -> bool:
+        if self.api_token is None:
+            return True
+        return headers.get('Authorization') == f'Bearer {self.api_token}'
+
+    def decode_value(self, content_type: str, body: bytes) -> str:
+        if not content_type.startswith('multipart/'):
+            return body.decode()
+
+        message = BytesParser(policy=HTTP).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+        for part in message.iter_parts():
+            if part.get_param('name', header='content-disposition') == 'value':
+                return part.get_payload(decode=True).decode()
+        return ''
+
+    def put(self, namespace_id: str, key: str, value: str) -> None:
+        with self.lock:
+            self.values[(namespace_id, key)] = value
+            self.update_count += 1
+
+    def get(self, title: str, key: str) -> str | None:
+        with self.lock:
+            return self.values.get((self.namespaces[title], key))
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,189 @@
+"""Time-to-detect and time-to-recover benchmark of NetworkDaemon on a simulated network
+
+Run from the repository root:
+
+    python -m simulation.daemon_benchmark --trials 10
+"""
+
+import contextlib
+import functools
+import json
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Callable, Dict, List, NamedTuple
+
+from network_daemon import NetworkDaemon
+from simulation.environment import SimulatedEnvironment
+from simulation.faults import FaultScenario
+
+class InstrumentedDaemon(NetworkDaemon):
+    """NetworkDaemon recording when a fault is detected and when connectivity is back"""
+    def __init__(self, config_path, state_path=None):
+        super().__init__(config_path, state_path)
+        self.detected_at: float | None = None
+        self.recovered_at: float | None = None
+        self.check_count = 0
+
+    def reset_marks(self) -> None:
+        self.detected_at = None
+        self.recovered_at = None
+
+    def action_try_fix_inet(self, remain_attempts: int) -> None:
+        if self.detected_at is None:
+            self.detected_at = time.time()
+        super().action_try_fix_inet(remain_attempts)
+
+    def action_check_inet(self, from_recover: bool = False) -> None:
+        # Recovery schedules a check with from_recover right after the internet is reachable again.
+        # The startup check also uses from_recover, so only count it after a detection
+        if from_recover and self.detected_at is not None and self.recovered_at is None:
+            self.recovered_at = time.time()
+        self.check_count += 1
+        super().action_check_inet(from_recover)
+
+class TrialResult(NamedTuple):
+    time_to_detect: float | None
+    time_to_recover: float | None
+
+def fault_deauth(env: SimulatedEnvironment) -> float:
+    """Gateway drops the session. Returns the time the fault ended"""
+    env.gateway.kick('127.0.0.1')
+    return time.time()
+
+def fault_link_outage(env: SimulatedEnvironment, duration_sec: float) -> float:
+    """WiFi link and gateway are unreachable for {duration_sec}"""
+    env.gateway.injector.set_outage(True)
+    env.wpa.injector.set_outage(True)
+    time.sleep(duration_sec)
+    env.gateway.injector.set_outage(False)
+    env.wpa.injector.set_outage(False)
+    return time.time()
+
+def run_trial(env: SimulatedEnvironment, daemon: InstrumentedDaemon, fault: Callable[[SimulatedEnvironment], float], timeout_sec: float) -> TrialResult:
+    daemon.reset_marks()
+    fault_start = time.time()
+    fault_end = fault(env)
+
+    deadline = fault_end + timeout_sec
+    while daemon.recovered_at is None and time.time() < deadline:
+        time.sleep(0.05)
+
+    detect = None if daemon.detected_at is None else daemon.detected_at - fault_start
+    recover = None if daemon.recovered_at is None else daemon.recovered_at - fault_end
+    return TrialResult(detect, recover)
+
+def summarize(values: List[float]) -> Dict[str, float] | None:
+    if len(values) == 0:
+        return None
+
+    values = sorted(values)
+    return {
+        'min': values[0],
+        'median': statistics.median(values),
+        'p90': values[min(len(values) - 1, int(len(values) * 0.9))],
+        'max': values[-1],
+        'mean': statistics.fmean(values)
+    }
+
+def wait_healthy(daemon: InstrumentedDaemon, timeout_sec: float) -> bool:
+    deadline = time.time() + timeout_sec
+    while daemon.recovered_at is None and time.time() < deadline:
+        time.sleep(0.05)
+    return daemon.recovered_at is not None
+
+def run_scenario(
+        name: str,
+        fault: Callable[[SimulatedEnvironment], float],
+        probe_scenario: FaultScenario,
+        trials: int,
+        settle_sec: float,
+        timeout_sec: float,
+        **config_overrides) -> Dict[str, object]:
+    env = SimulatedEnvironment(**config_overrides)
+    env.start()
+    env.internet.injector.set_scenario(probe_scenario)
+
+    daemon = InstrumentedDaemon(env.config_path, env.state_path)
+    daemon.apply_action(time.time(), functools.partial(daemon.action_check_inet, from_recover = True))
+    env.run_daemon(daemon)
+
+    results: List[TrialResult] = []
+    start = time.time()
+    try:
+        # The simulated user starts offline, first recovery brings the daemon to steady state
+        wait_healthy(daemon, timeout_sec)
+
+        for i in range(trials):
+            time.sleep(settle_sec)
+            results.append(run_trial(env, daemon, fault, timeout_sec))
+    finally:
+        env.stop(daemon)
+    duration = time.time() - start
+
+    return {
+        'scenario': name,
+        'trials': trials,
+        'failures': sum(1 for i in results if i.time_to_recover is None),
+        'time_to_detect': summarize([i.time_to_detect for i in results if i.time_to_detect is not None]),
+        'time_to_recover': summarize([i.time_to_recover for i in results if i.time_to_recover is not None]),
+        'logins': env.gateway.login_count,
+        'kv_updates': env.kv.update_count,
+        'checks_per_min': daemon.check_count / duration * 60
+    }
+
+if __name__ == '__main__':
+    parser = ArgumentParser("NetworkDaemon recovery benchmark")
+    parser.add_argument('--trials', type=int, default=5, help='Trials per scenario. Default 5')
+    parser.add_argument('--check-interval', type=float, default=2, help='Daemon check_interval_sec. Default 2')
+    parser.add_argument('--fix-retry-interval', type=float, default=1, help='Daemon fix_retry_interval_sec. Default 1')
+    parser.add_argument('--outage', type=float, default=5, help='Link outage duration in seconds. Default 5')
+    parser.add_argument('--settle', type=float, default=1, help='Healthy time between trials in seconds. Default 1')
+    parser.add_argument('--timeout', type=float, default=120, help='Give up a trial after seconds. Default 120')
+    parser.add_argument('--scenario', '-s', type=str, action='append', choices=['deauth', 'lossy-deauth', 'link-outage'])
+    parser.add_argument('--probe-family', type=str, default='ipv4', choices=['ipv4', 'ipv6', 'any', 'dual'], help='Daemon probe_family. Default ipv4')
+    parser.add_argument('--adaptive', action='store_true', default=False, help='Adaptive check interval between 1/4 and 8 times --check-interval')
+    parser.add_argument('--output', '-o', type=str, default=None, help='Append JSON lines to file')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    lossy_probe = FaultScenario(latency_sec=0.05, latency_jitter_sec=0.2, loss_rate=0.2)
+    scenarios = {
+        'deauth': (fault_deauth, FaultScenario()),
+        'lossy-deauth': (fault_deauth, lossy_probe),
+        'link-outage': (functools.partial(fault_link_outage, duration_sec=args.outage), FaultScenario()),
+    }
+
+    cadence = {'adaptive_check_interval': False}
+    if args.adaptive:
+        cadence = {
+            'adaptive_check_interval': True,
+            'check_interval_min_sec': args.check_interval / 4,
+            'check_interval_max_sec': args.check_interval * 8,
+            'check_history_size': 5,
+            'check_recover_watch_sec': args.check_interval * 2
+        }
+
+    for name in args.scenario or scenarios.keys():
+        fault, probe_scenario = scenarios[name]
+        # Keep stdout for the report, daemon logs go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run_scenario(
+                name,
+                fault,
+                probe_scenario,
+                args.trials,
+                args.settle,
+                args.timeout,
+                check_interval_sec = args.check_interval,
+                fix_retry_interval_sec = args.fix_retry_interval,
+                cf_retry_interval_sec = args.fix_retry_interval,
+                probe_family = args.probe_family,
+                **cadence)
+
+        line = json.dumps(report)
+        print(line)
+        if args.output is not None:
+            with open(args.output, 'a') as f:
+                f.write(line + '\n')
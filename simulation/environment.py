@@ -0,0 +1,80 @@
+"""Simulated campus network wired to a NetworkDaemon configuration"""
+
+import os
+import tempfile
+import threading
+
+from network_daemon import DaemonConfiguration, DaemonConfigurationHelpers, NetworkDaemon
+from simulation.cloudflare_kv import FakeCloudflareKV
+from simulation.srun_gateway import FakeInternetServer, FakeSrunGateway
+from simulation.wpa_supplicant import FakeWPASupplicant
+
+SIM_USERNAME = 'sim-user'
+SIM_PASSWORD = 'sim-password'
+SIM_API_TOKEN = 'sim-token'
+SIM_INTERFACE = 'lo' # Must exist with an IPv4 address, so get_local_ip finds something to publish to the fake KV
+
+class SimulatedEnvironment:
+    """Start fake SRUN gateway, internet, wpa_supplicant and Cloudflare KV servers.
+
+    {config} points a NetworkDaemon at them. Extra keyword arguments override
+    configuration fields, e.g. check_interval_sec."""
+    def __init__(self, associate_delay_sec: float = 0.5, seed: int | None = None, **config_overrides):
+        self.work_dir = tempfile.TemporaryDirectory(prefix='bnaod-sim-')
+        self.gateway = FakeSrunGateway({SIM_USERNAME: SIM_PASSWORD}, seed=seed)
+        self.internet = FakeInternetServer(self.gateway, seed=seed)
+        self.wpa = FakeWPASupplicant(self.work_dir.name, SIM_INTERFACE, associate_delay_sec, seed=seed)
+        self.kv = FakeCloudflareKV(api_token=SIM_API_TOKEN, seed=seed)
+
+        config = DaemonConfiguration(
+            inet_check_url = f'{self.internet.base_url}/',
+            gw_check_url = f'{self.gateway.base_url}/',
+            wpa_ctrl_interface = self.work_dir.name,
+            interface_name = SIM_INTERFACE,
+            dhcp_renew = False,
+            gw_server = f'127.0.0.1:{self.gateway.port}',
+            gw_protocol = 'http',
+            username = SIM_USERNAME,
+            password = SIM_PASSWORD,
+            auth_acid = self.gateway.ac_id,
+            auth_n = self.gateway.n,
+            auth_n_type = self.gateway.n_type,
+            cf_api_token = SIM_API_TOKEN,
+            cf_api_base_url = self.kv.base_url)
+
+        self.config = config._replace(**config_overrides)
+        self.config_path = os.path.join(self.work_dir.name, 'config.json')
+        self.state_path = os.path.join(self.work_dir.name, 'state.json')
+        DaemonConfigurationHelpers.store_config(self.config_path, self.config)
+
+        self.daemon_thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self.gateway.start()
+        self.internet.start()
+        self.wpa.start()
+        self.kv.start()
+
+    def run_daemon(self, daemon: NetworkDaemon) -> None:
+        """Run {daemon} loop in a background thread"""
+        self.daemon_thread = threading.Thread(target=daemon.daemon_loop, daemon=True)
+        self.daemon_thread.start()
+
+    def stop(self, daemon: NetworkDaemon | None = None) -> None:
+        if daemon is not None:
+            daemon.daemon_stop()
+        if self.daemon_thread is not None:
+            self.daemon_thread.join()
+
+        self.kv.stop()
+        self.wpa.stop()
+        self.internet.stop()
+        self.gateway.stop()
+        self.work_dir.cleanup()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,53 @@
+"""Fault injection shared by simulated servers"""
+
+import random
+import threading
+import time
+from typing import NamedTuple, Tuple
+
+class FaultScenario(NamedTuple):
+    latency_sec: float = 0 # Delay added before every answer
+    latency_jitter_sec: float = 0 # Uniform random jitter added on top of {latency_sec}
+    loss_rate: float = 0 # Probability of dropping a request without answer
+    outages: Tuple[Tuple[float, float], ...] = () # (start, end) offsets in seconds from injector start, nothing is answered inside
+
+class FaultInjector:
+    """Decide the fate of each simulated request according to a scenario.
+
+    Outages can be scheduled in the scenario or switched manually with {set_outage}."""
+    def __init__(self, scenario: FaultScenario = FaultScenario(), seed: int | None = None):
+        self.scenario = scenario
+        self.random = random.Random(seed)
+        self.start_time = time.time()
+        self.manual_outage = False
+        self.lock = threading.Lock()
+
+    def set_scenario(self, scenario: FaultScenario) -> None:
+        with self.lock:
+            self.scenario = scenario
+            self.start_time = time.time()
+
+    def set_outage(self, outage: bool) -> None:
+        self.manual_outage = outage
+
+    def in_outage(self) -> bool:
+        if self.manual_outage:
+            return True
+
+        offset = time.time() - self.start_time
+        return any(start <= offset < end for start, end in self.scenario.outages)
+
+    def should_drop(self) -> bool:
+        """Return True if the current request must not be answered"""
+        if self.in_outage():
+            return True
+
+        with self.lock:
+            return self.random.random() < self.scenario.loss_rate
+
+    def delay(self) -> None:
+        with self.lock:
+            latency = self.scenario.latency_sec + self.random.uniform(0, self.scenario.latency_jitter_sec)
+
+        if latency > 0:
+            time.sleep(latency)
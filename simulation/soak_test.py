@@ -0,0 +1,118 @@
+"""Soak test of NetworkDaemon resource usage on a simulated network
+
+Drives many deauth and link outage recover cycles through one daemon and checks that
+RSS, open file descriptors, threads and pending actions stay flat. Run from the
+repository root:
+
+    python -m simulation.soak_test --cycles 2000
+"""
+
+import contextlib
+import functools
+import gc
+import json
+import os
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from typing import Dict, List
+
+from simulation.daemon_benchmark import InstrumentedDaemon, fault_deauth, fault_link_outage, run_trial
+from simulation.environment import SimulatedEnvironment
+
+def read_rss_kb() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+def sample(daemon: InstrumentedDaemon, cycle: int) -> Dict[str, int]:
+    gc.collect()
+    return {
+        'cycle': cycle,
+        'rss_kb': read_rss_kb(),
+        'fds': len(os.listdir('/proc/self/fd')),
+        'threads': threading.active_count(),
+        'pending_actions': len(daemon.action_queue)
+    }
+
+def run_soak(
+        cycles: int,
+        warmup: int,
+        outage_every: int,
+        outage_sec: float,
+        timeout_sec: float,
+        sample_every: int) -> List[Dict[str, int]]:
+    env = SimulatedEnvironment(
+        associate_delay_sec = 0,
+        check_interval_sec = 0.05,
+        check_interval_min_sec = 0.05,
+        check_interval_max_sec = 0.2,
+        check_history_size = 5,
+        check_recover_watch_sec = 0.2,
+        fix_retry_interval_sec = 0.05,
+        cf_retry_interval_sec = 0.05,
+        auth_check_interval_sec = 0.01,
+        auth_logout_wait_sec = 0.01)
+    env.start()
+
+    daemon = InstrumentedDaemon(env.config_path, env.state_path)
+    daemon.apply_action(time.time(), functools.partial(daemon.action_check_inet, from_recover = True))
+    env.run_daemon(daemon)
+
+    samples: List[Dict[str, int]] = []
+    link_outage = functools.partial(fault_link_outage, duration_sec = outage_sec)
+    try:
+        for cycle in range(warmup + cycles):
+            fault = link_outage if outage_every > 0 and cycle % outage_every == outage_every - 1 else fault_deauth
+            result = run_trial(env, daemon, fault, timeout_sec)
+            if result.time_to_recover is None:
+                raise RuntimeError(f"Daemon did not recover in cycle {cycle}")
+
+            if cycle >= warmup and (cycle - warmup) % sample_every == 0:
+                samples.append(sample(daemon, cycle))
+
+        samples.append(sample(daemon, warmup + cycles))
+    finally:
+        env.stop(daemon)
+
+    return samples
+
+if __name__ == '__main__':
+    parser = ArgumentParser("NetworkDaemon soak test")
+    parser.add_argument('--cycles', type=int, default=2000, help='Recover cycles after warm-up. Default 2000')
+    parser.add_argument('--warmup', type=int, default=100, help='Cycles before the first sample. Default 100')
+    parser.add_argument('--outage-every', type=int, default=50, help='Every Nth cycle is a link outage, 0 for none. Default 50')
+    # Shorter outages are absorbed by the retries of check_network_access and never detected
+    parser.add_argument('--outage', type=float, default=1.5, help='Link outage duration in seconds. Default 1.5')
+    parser.add_argument('--timeout', type=float, default=60, help='Give up a cycle after seconds. Default 60')
+    parser.add_argument('--sample-every', type=int, default=100, help='Cycles between samples. Default 100')
+    parser.add_argument('--max-rss-growth-kb', type=int, default=4096, help='Allowed RSS growth after warm-up. Default 4096')
+    parser.add_argument('--max-fd-growth', type=int, default=2, help='Allowed fd growth after warm-up. Default 2')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    # Keep stdout for the report, daemon logs go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        samples = run_soak(args.cycles, args.warmup, args.outage_every, args.outage, args.timeout, args.sample_every)
+
+    for i in samples:
+        print(json.dumps(i))
+
+    first, last = samples[0], samples[-1]
+    failures = []
+    if last['rss_kb'] - first['rss_kb'] > args.max_rss_growth_kb:
+        failures.append(f"RSS grew by {last['rss_kb'] - first['rss_kb']} kB")
+    if last['fds'] - first['fds'] > args.max_fd_growth:
+        failures.append(f"Open fds grew by {last['fds'] - first['fds']}")
+    # Request handler threads of the simulated servers may be alive at sampling time
+    if last['threads'] > first['threads'] + 2:
+        failures.append(f"Threads grew from {first['threads']} to {last['threads']}")
+    if max(i['pending_actions'] for i in samples) > 2:
+        failures.append(f"Up to {max(i['pending_actions'] for i in samples)} pending actions")
+
+    for i in failures:
+        print(f'FAIL {i}')
+    exit(1 if len(failures) != 0 else 0)
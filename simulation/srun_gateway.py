@@ -0,0 +1,249 @@
+"""Local stand-in for the SRUN portal and the captive internet behind it"""
+
+import json
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from encryption.srun_hash import get_md5, get_sha1
+from encryption.srun_base64 import get_base64
+from encryption.srun_xencode import get_xencode
+from simulation.faults import FaultInjector, FaultScenario
+
+PORTAL_REDIRECT_PAGE = '<html><script>top.self.location.href="https://gw.buaa.edu.cn/index_68.html"</script></html>'
+INTERNET_PAGE = '<html><body>Welcome to the simulated internet</body></html>'
+
+class SimulatedHTTPHandler(BaseHTTPRequestHandler):
+    """Request handler which applies the server fault injector before answering"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        injector: FaultInjector = self.server.injector
+        if injector.should_drop():
+            self.close_connection = True
+            return
+
+        injector.delay()
+
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        result = self.server.owner.handle(url.path, params, self.client_address[0])
+        if result is None:
+            self.close_connection = True
+            return
+
+        status, content_type, body = result
+        payload = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+class SimulatedHTTPServer:
+    """Threaded HTTP server on localhost with fault injection"""
+    def __init__(self, port: int = 0, scenario: FaultScenario = FaultScenario(), seed: int | None = None):
+        self.injector = FaultInjector(scenario, seed)
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), SimulatedHTTPHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.injector = self.injector
+        self.httpd.owner = self
+        self.thread: threading.Thread | None = None
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def handle(self, path: str, params: Dict[str, str], client_ip: str) -> Tuple[int, str, str] | None:
+        """Return (status, content type, body) of the answer, or None to drop the request"""
+        return 404, 'text/plain', 'Not found'
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+class FakeSrunGateway(SimulatedHTTPServer):
+    """SRUN portal implementing get_challenge, srun_portal and rad_user_info.
+
+    Login requests are checked by recomputing info, password and chksum fields from
+    the registered accounts, so any deviation of the client encryption is rejected."""
+    def __init__(self,
+            accounts: Dict[str, str],
+            ac_id: int = 68,
+            n: int = 200,
+            n_type: int = 1,
+            port: int = 0,
+            scenario: FaultScenario = FaultScenario(),
+            seed: int | None = None):
+        super().__init__(port, scenario, seed)
+        self.accounts = accounts
+        self.ac_id = ac_id
+        self.n = n
+        self.n_type = n_type
+        self.challenges: Dict[str, str] = {}
+        self.online: Dict[str, str] = {} # ip -> username
+        self.login_count = 0
+        self.lock = threading.Lock()
+
+    def is_online(self, ip: str) -> bool:
+        with self.lock:
+            return ip in self.online
+
+    def kick(self, ip: str) -> None:
+        """Force the user at {ip} offline, as the real gateway does on session expiry"""
+        with self.lock:
+            self.online.pop(ip, None)
+
+    def jsonp(self, callback: str, value: object):
+        return 200, 'text/javascript', f'{callback}({json.dumps(value)})'
+
+    def handle(self, path: str, params: Dict[str, str], client_ip: str):
+        if path == '/':
+            return 200, 'text/html', '<html><body>SRUN portal</body></html>'
+        if path == '/cgi-bin/get_challenge':
+            return self.handle_challenge(params, client_ip)
+        if path == '/cgi-bin/srun_portal':
+            return self.handle_portal(params, client_ip)
+        if path == '/cgi-bin/rad_user_info':
+            return self.handle_user_info(params, client_ip)
+        return super().handle(path, params, client_ip)
+
+    def handle_challenge(self, params: Dict[str, str], client_ip: str):
+        ip = params.get('ip') or client_ip
+        challenge = secrets.token_hex(32)
+        with self.lock:
+            self.challenges[ip] = challenge
+
+        return self.jsonp(params.get('callback', 'jsonp'), {
+            'challenge': challenge,
+            'client_ip': ip,
+            'error': 'ok',
+            'res': 'ok'
+        })
+
+    def handle_user_info(self, params: Dict[str, str], client_ip: str):
+        callback = params.get('callback', 'jsonp')
+        with self.lock:
+            username = self.online.get(client_ip)
+
+        if username is None:
+            return self.jsonp(callback, {'error': 'not_online_error', 'client_ip': client_ip})
+
+        return self.jsonp(callback, {'error': 'ok', 'online_ip': client_ip, 'user_name': username})
+
+    def handle_portal(self, params: Dict[str, str], client_ip: str):
+        callback = params.get('callback', 'jsonp')
+        action = params.get('action')
+        ip = params.get('ip') or client_ip
+
+        if action == 'logout':
+            with self.lock:
+                self.online.pop(ip, None)
+            return self.jsonp(callback, {'error': 'ok', 'res': 'ok'})
+
+        if action != 'login':
+            return self.jsonp(callback, {'error': 'action_error', 'res': 'action_error'})
+
+        with self.lock:
+            token = self.challenges.pop(ip, None)
+
+        error = self.verify_login(params, ip, token)
+        if error is not None:
+            return self.jsonp(callback, {'error': 'login_error', 'res': 'login_error', 'error_msg': error})
+
+        with self.lock:
+            self.online[ip] = params['username']
+            self.login_count += 1
+
+        return self.jsonp(callback, {'error': 'ok', 'res': 'ok', 'suc_msg': 'login_ok', 'online_ip': ip})
+
+    def verify_login(self, params: Dict[str, str], ip: str, token: str | None) -> str | None:
+        """Return error message of an invalid login request, or None if it is valid"""
+        if token is None:
+            return 'E2620: challenge expired'
+
+        username = params.get('username', '')
+        password = self.accounts.get(username)
+        if password is None:
+            return 'E2531: user not found'
+
+        if params.get('ac_id') != str(self.ac_id):
+            return 'E2606: ac_id mismatch'
+
+        hmd5 = get_md5(password, token)
+        if params.get('password') != '{MD5}' + hmd5:
+            return 'E2901: (Third party 1)bind_user2: ldap_bind error'
+
+        info_json = json.dumps({
+            'username': username,
+            'password': password,
+            'ip': ip,
+            'acid': str(self.ac_id),
+            'enc_ver': 'srun_bx1'
+        })
+        info = '{SRBX1}' + get_base64(get_xencode(info_json, token))
+        if params.get('info') != info:
+            return 'E2833: info decode error'
+
+        chkstr = ''.join(token + i for i in [
+            username, hmd5, str(self.ac_id), ip, str(self.n), str(self.n_type), info])
+        if params.get('chksum') != get_sha1(chkstr):
+            return 'E2834: chksum error'
+
+        return None
+
+class FakeInternetServer(SimulatedHTTPServer):
+    """Internet probe target. Clients not online at {gateway} get the captive portal page"""
+    def __init__(self,
+            gateway: FakeSrunGateway,
+            port: int = 0,
+            scenario: FaultScenario = FaultScenario(),
+            seed: int | None = None):
+        super().__init__(port, scenario, seed)
+        self.gateway = gateway
+
+    def handle(self, path: str, params: Dict[str, str], client_ip: str):
+        if self.gateway.injector.in_outage():
+            # Traffic to the internet passes through the gateway
+            return None
+
+        if not self.gateway.is_online(client_ip):
+            return 200, 'text/html', PORTAL_REDIRECT_PAGE
+
+        return 200, 'text/html', INTERNET_PAGE
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser("Simulated SRUN gateway")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--inet-port', type=int, default=8081)
+    parser.add_argument('--username', type=str, default='user')
+    parser.add_argument('--password', type=str, default='password')
+    args = parser.parse_args()
+
+    gateway = FakeSrunGateway({args.username: args.password}, port=args.port)
+    inet = FakeInternetServer(gateway, port=args.inet_port)
+    inet.start()
+    print(f'Gateway at {gateway.base_url}, internet at {inet.base_url}')
+    gateway.httpd.serve_forever()
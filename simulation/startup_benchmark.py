@@ -0,0 +1,72 @@
+"""Import time and RSS of daemon entry points
+
+Every target runs in a fresh interpreter. Run from the repository root:
+
+    python -m simulation.startup_benchmark --runs 5
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+from argparse import ArgumentParser
+from typing import Dict, List
+
+HEAVY_MODULES = ['cloudflare', 'pydantic', 'requests', 'urllib3', 'netifaces', 'daemon', 'lockfile']
+
+TARGETS = {
+    'network_daemon': 'import network_daemon',
+    'network_daemon+daemon': (
+        'import os, tempfile, network_daemon; '
+        'work_dir = tempfile.TemporaryDirectory(); path = os.path.join(work_dir.name, "config.json"); '
+        'network_daemon.DaemonConfigurationHelpers.store_config(path, network_daemon.DaemonConfiguration()); '
+        'network_daemon.NetworkDaemon(path)'),
+    'network_detect': 'import network_detect',
+    'srun_auth': 'import srun_auth',
+    'cf_helper+sdk': 'import cf_helper; from cloudflare import Cloudflare',
+}
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+exec(sys.argv[1])
+elapsed = time.perf_counter() - start
+rss_kb = 0
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+print(json.dumps({
+    'import_sec': elapsed,
+    'rss_kb': rss_kb,
+    'modules': len(sys.modules),
+    'heavy': [i for i in json.loads(sys.argv[2]) if i in sys.modules]
+}))
+'''
+
+def measure(statement: str, runs: int) -> Dict[str, object]:
+    samples: List[Dict[str, object]] = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, statement, json.dumps(HEAVY_MODULES)],
+            capture_output=True, text=True, check=True)
+        samples.append(json.loads(result.stdout.splitlines()[-1]))
+
+    return {
+        'import_sec_median': statistics.median(i['import_sec'] for i in samples),
+        'import_sec_min': min(i['import_sec'] for i in samples),
+        'rss_kb_median': statistics.median(i['rss_kb'] for i in samples),
+        'modules': samples[-1]['modules'],
+        'heavy_modules_loaded': samples[-1]['heavy']
+    }
+
+if __name__ == '__main__':
+    parser = ArgumentParser("Startup import time and RSS benchmark")
+    parser.add_argument('--runs', type=int, default=5, help='Interpreter runs per target. Default 5')
+    parser.add_argument('--target', '-t', type=str, action='append', choices=list(TARGETS.keys()))
+
+    args = parser.parse_args(sys.argv[1:])
+
+    for name in args.target or TARGETS.keys():
+        report = {'target': name, **measure(TARGETS[name], args.runs)}
+        print(json.dumps(report))
@@ -0,0 +1,162 @@
+"""Local stand-in for the wpa_supplicant control socket"""
+
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+from simulation.faults import FaultInjector, FaultScenario
+
+class FakeNetwork:
+    def __init__(self, id: int):
+        self.id = id
+        self.ssid = ''
+        self.variables: Dict[str, str] = {}
+        self.enabled = False
+
+class FakeWPASupplicant:
+    """Answer control commands on {ctrl_dir}/{if_name} like wpa_supplicant does.
+
+    Selecting a network moves the link to COMPLETED after {associate_delay_sec}. While
+    the injector is in outage the link is reported as DISCONNECTED and commands are
+    answered normally, as the radio is down but the daemon is alive."""
+    def __init__(self,
+            ctrl_dir: str,
+            if_name: str,
+            associate_delay_sec: float = 0.5,
+            scenario: FaultScenario = FaultScenario(),
+            seed: int | None = None):
+        self.ctrl_path = os.path.join(ctrl_dir, if_name)
+        self.associate_delay_sec = associate_delay_sec
+        self.injector = FaultInjector(scenario, seed)
+        self.networks: Dict[int, FakeNetwork] = {}
+        self.next_id = 0
+        self.selected: int | None = None
+        self.selected_time = 0.0
+        self.saved_config_count = 0
+        self.command_count: Counter[str] = Counter()
+        self.lock = threading.Lock()
+
+        if os.path.exists(self.ctrl_path):
+            os.remove(self.ctrl_path)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.ctrl_path)
+        self.sock.settimeout(0.1)
+        self.loop_run = True
+        self.thread: threading.Thread | None = None
+
+    def wpa_state(self) -> str:
+        if self.injector.in_outage() or self.selected is None:
+            return 'DISCONNECTED'
+        if time.time() - self.selected_time < self.associate_delay_sec:
+            return 'ASSOCIATING'
+        return 'COMPLETED'
+
+    def execute(self, cmd: str) -> List[str]:
+        """Return datagrams sent back for {cmd}"""
+        args = cmd.split(' ')
+        name = args[0]
+
+        with self.lock:
+            self.command_count[name] += 1
+
+            if name == 'ATTACH' or name == 'DETACH':
+                return ['OK\n']
+
+            if name == 'LIST_NETWORKS':
+                lines = ['network id / ssid / bssid / flags']
+                for i in self.networks.values():
+                    flags = '[CURRENT]' if i.id == self.selected else ''
+                    lines.append(f'{i.id}\t{i.ssid}\tany\t{flags}')
+                return ['\n'.join(lines) + '\n']
+
+            if name == 'ADD_NETWORK':
+                network = FakeNetwork(self.next_id)
+                self.next_id += 1
+                self.networks[network.id] = network
+                # With ATTACH the event arrives right before the command answer
+                return [f'<3>CTRL-EVENT-NETWORK-ADDED {network.id}', f'{network.id}\n']
+
+            if name == 'REMOVE_NETWORK':
+                if self.networks.pop(int(args[1]), None) is None:
+                    return ['FAIL\n']
+                return ['OK\n']
+
+            if name == 'SET_NETWORK':
+                network = self.networks.get(int(args[1]))
+                if network is None or len(args) < 4:
+                    return ['FAIL\n']
+                value = ' '.join(args[3:])
+                network.variables[args[2]] = value
+                if args[2] == 'ssid':
+                    network.ssid = value.strip('"')
+                return ['OK\n']
+
+            if name == 'ENABLE_NETWORK':
+                network = self.networks.get(int(args[1]))
+                if network is None:
+                    return ['FAIL\n']
+                network.enabled = True
+                return ['OK\n']
+
+            if name == 'SELECT_NETWORK':
+                if int(args[1]) not in self.networks:
+                    return ['FAIL\n']
+                self.selected = int(args[1])
+                self.selected_time = time.time()
+                return ['OK\n']
+
+            if name == 'SAVE_CONFIG':
+                self.saved_config_count += 1
+                return ['OK\n']
+
+            if name == 'STATUS':
+                lines = [f'wpa_state={self.wpa_state()}']
+                if self.selected is not None:
+                    lines.append(f'id={self.selected}')
+                    lines.append(f'ssid={self.networks[self.selected].ssid}')
+                return ['\n'.join(lines) + '\n']
+
+            return ['UNKNOWN COMMAND\n']
+
+    def serve_forever(self) -> None:
+        while self.loop_run:
+            try:
+                data, address = self.sock.recvfrom(4096)
+            except (TimeoutError, socket.timeout):
+                continue
+            except OSError:
+                break
+
+            if not self.injector.in_outage() and self.injector.should_drop():
+                continue
+
+            self.injector.delay()
+
+            for i in self.execute(data.decode('utf-8')):
+                try:
+                    self.sock.sendto(i.encode(), address)
+                except OSError:
+                    break
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.loop_run = False
+        if self.thread is not None:
+            self.thread.join()
+        self.sock.close()
+        if os.path.exists(self.ctrl_path):
+            os.remove(self.ctrl_path)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -1,14 +1,40 @@
 """SRUN auth library"""
 
-import re
 import time
 import json
-from typing import Literal, Tuple
+from typing import Dict, Literal, Tuple
 import requests
 
 from encryption.srun_hash import get_md5, get_sha1
 from encryption.srun_base64 import get_base64
 from encryption.srun_xencode import get_xencode
+from network_detect import create_session
+
+STATE_CALLBACK = 'jQuery_11414'
+CHALLENGE_CALLBACK_PREFIX = 'jQuery112404953340710317169_'
+PORTAL_CALLBACK_PREFIX = 'jQuery11240645308969735664_'
+
+class SrAuthException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+def parse_jsonp(response: str, callback: str) -> Dict[str, object]:
+    """Decode JSONP answer {callback}(<json>)"""
+    body = response.strip().removesuffix(';')
+
+    if not body.startswith(callback) or body[len(callback):len(callback) + 1] != '(' or not body.endswith(')'):
+        raise SrAuthException(f"Malformed JSONP answer for callback {callback}: {body[:64]!r}")
+
+    try:
+        value = json.loads(body[len(callback) + 1:-1])
+    except ValueError as e:
+        raise SrAuthException(f"Invalid JSON in answer for callback {callback}: {e}") from e
+
+    if not isinstance(value, dict):
+        raise SrAuthException(f"Unexpected JSON value in answer for callback {callback}: {type(value).__name__}")
+
+    return value
 
 
 class SrAuthSession(object):
@@ -19,7 +45,8 @@ class SrAuthSession(object):
 			n: int,
 			ac_id: int,
 			encode_type: Literal['srun_bx1'] = 'srun_bx1',
-			protocol: Literal['https'] | Literal['http'] = 'https'):
+			protocol: Literal['https'] | Literal['http'] = 'https',
+			http: requests.Session | None = None):
 
         assert protocol in {'https','http'}
         assert encode_type in {'srun_bx1'}
@@ -30,11 +57,13 @@ class SrAuthSession(object):
         self.n_type = n_type
         self.encode_type = encode_type
         self.ac_id = ac_id
+        # Login must come from the IPv4 address the gateway authorizes
+        self.http = create_session() if http is None else http
 
         self.base_url = f'{protocol}://{gw_server}'
         self.get_challenge_api = f'{self.base_url}/cgi-bin/get_challenge'
         self.srun_portal_api = f'{self.base_url}/cgi-bin/srun_portal'
-        self.get_info_api = f'{self.base_url}/cgi-bin/rad_user_info?callback=jQuery_11414'
+        self.get_info_api = f'{self.base_url}/cgi-bin/rad_user_info?callback={STATE_CALLBACK}'
 
         self.headers = {
 			'referer': f'{self.base_url}/srun_portal_success?ac_id={ac_id}',
@@ -65,20 +94,28 @@ class SrAuthSession(object):
 
         return json.dumps(info_temp)
 
-    def get_state(self) -> object:
+    def request_jsonp(self, url: str, callback: str, params: Dict[str, object] | None = None) -> Dict[str, object]:
+        """Send GET request and decode JSONP answer"""
+        response = self.http.get(
+            url,
+            params=params,
+            headers=self.headers,
+            timeout = 2000)
+
+        return parse_jsonp(response.text, callback)
+
+    def get_state(self, ip: str | None = None) -> object:
         """Get auth state"""
-        init_res=requests.get(self.get_info_api,headers=self.headers, timeout=2000)
-        response = init_res.text
-        response_json = re.search(r'jQuery_11414\((.*?)\)',response)[1]
-        init_info = json.loads(response_json)
-        return init_info
+        return self.request_jsonp(self.get_info_api, STATE_CALLBACK, None if ip is None else {'ip': ip})
 
     def get_ip(self) -> str:
         """Get local IP"""
         print('Initializting IP address.')
         init_info = self.get_state()
         
-        ip: str = init_info['client_ip'] if 'client_ip' in init_info.keys() else init_info['online_ip']
+        ip: str | None = init_info.get('client_ip', init_info.get('online_ip'))
+        if ip is None:
+            raise SrAuthException(f"No IP in state answer. Error = {init_info.get('error')}")
 
         print(f'[AUTH] Got IP = {ip}')
 
@@ -86,21 +123,18 @@ class SrAuthSession(object):
 
     def get_token(self, username:str, ip: str):
         """Request challege token"""
+        timestamp = int(time.time()*1000)
         get_challenge_params={
-            "callback": "jQuery112404953340710317169_"+str(int(time.time()*1000)),
+            "callback": f"{CHALLENGE_CALLBACK_PREFIX}{timestamp}",
             "username":username,
             "ip":ip,
-            "_":int(time.time()*1000),
+            "_":timestamp,
 	    }
-        get_challenge_res = requests.get(
-            self.get_challenge_api,
-            params=get_challenge_params,
-            headers=self.headers,
-            timeout = 2000)
-        
-        get_challenge_json_value = re.search(
-            f"{get_challenge_params['callback']}\\((.*?)\\)", get_challenge_res.text)[1]
-        get_challenge_json = json.loads(get_challenge_json_value)
+        get_challenge_json = self.request_jsonp(
+            self.get_challenge_api, get_challenge_params['callback'], get_challenge_params)
+
+        if 'challenge' not in get_challenge_json:
+            raise SrAuthException(f"No challenge in answer. Error = {get_challenge_json.get('error')}")
         
         challenge = get_challenge_json['challenge']
         print(f'[AUTH] got challenge {challenge}')
@@ -116,39 +150,37 @@ class SrAuthSession(object):
         chksum=get_sha1(self.get_chksum(hmd5, ip, token, username, info_tex))
         return token, info_tex, hmd5, chksum
 
-    def logout(self, username: str) -> bool:
-        ip = self.get_ip()
+    def logout(self, username: str, ip: str | None = None) -> bool:
+        if ip is None:
+            ip = self.get_ip()
         srun_portal_params = {
-            'callback': 'jQuery11240645308969735664_'+str(int(time.time()*1000)),
+            'callback': f'{PORTAL_CALLBACK_PREFIX}{int(time.time()*1000)}',
             "action": "logout",
             "ac_id": str(self.ac_id),
             "ip": ip,
             "username": username
         }
 
-        srun_portal_res = requests.get(
-            self.srun_portal_api,
-            params=srun_portal_params,
-            headers=self.headers,
-            timeout = 2000)
-
-        srun_portal_json_val = re.search(
-            f'{srun_portal_params['callback']}\\((.*?)\\)', srun_portal_res.text)[1]
-
-        srun_portal_json = json.loads(srun_portal_json_val)
+        srun_portal_json = self.request_jsonp(
+            self.srun_portal_api, srun_portal_params['callback'], srun_portal_params)
 
-        return srun_portal_json['error'] == 'ok'
+        return srun_portal_json.get('error') == 'ok'
         
         
-    def login(self, username:str, password:str, attempts: int = 6):
-        """Login auth"""
-        ip = self.get_ip()
+    def login(self, username:str, password:str, attempts: int = 6, ip: str | None = None, double_stack: bool = False):
+        """Login auth. {double_stack} asks the gateway to authorize IPv6 along with IPv4"""
+        if ip is None:
+            ip = self.get_ip()
+
+        if attempts < 1:
+            raise SrAuthException(f"Login needs at least 1 attempt, got {attempts}")
 
         for i in range(attempts):
             _, info_tex, hmd5, chksum = self.encrypt(ip, username, password)
 
+            timestamp = int(time.time()*1000)
             srun_portal_params={
-                'callback': 'jQuery11240645308969735664_'+str(int(time.time()*1000)),
+                'callback': f'{PORTAL_CALLBACK_PREFIX}{timestamp}',
                 'action':'login',
                 'username':username,
                 'password':'{MD5}'+hmd5,
@@ -160,25 +192,17 @@ class SrAuthSession(object):
                 'type':str(self.n_type),
                 'os':'windows+10',
                 'name':'windows',
-                'double_stack':'0',
-                '_':int(time.time()*1000)
+                'double_stack':'1' if double_stack else '0',
+                '_':timestamp
             }
 
-            srun_portal_res = requests.get(
-                self.srun_portal_api,
-                params=srun_portal_params,
-                headers=self.headers,
-                timeout = 2000)
-
-            srun_portal_json_val = re.search(
-                f'{srun_portal_params['callback']}\\((.*?)\\)', srun_portal_res.text)[1]
-
-            srun_portal_json = json.loads(srun_portal_json_val)
+            srun_portal_json = self.request_jsonp(
+                self.srun_portal_api, srun_portal_params['callback'], srun_portal_params)
 
-            if srun_portal_json['error'] == 'ok':
+            if srun_portal_json.get('error') == 'ok':
                 break
 
-            print(f'Login failed. Error = {srun_portal_json['error']}. Retry')
+            print(f'Login failed. Error = {srun_portal_json.get('error')}. Retry')
         
         return srun_portal_json
 
@@ -190,25 +214,36 @@ def srun_auth_recover(
         username:str, 
         password: str,
         attempt: int = 5,
-        attempt_interval: float = 1) -> bool:
+        attempt_interval: float = 1,
+        protocol: Literal['https'] | Literal['http'] = 'https',
+        double_stack: bool = False,
+        logout_wait: float = 3) -> bool:
     
-    session = SrAuthSession(gw_server, auth_n_type, auth_n, auth_acid)
-    state = session.get_state()
+    session = SrAuthSession(gw_server, auth_n_type, auth_n, auth_acid, protocol = protocol)
 
-    if state['error'] == 'ok':
-        print("Already login. Try logout.")
-        session.logout(username)
-        time.sleep(3)
+    try:
+        state = session.get_state()
 
-    session.login(username, password)
+        if state.get('error') == 'ok':
+            print("Already login. Try logout.")
+            session.logout(username)
+            time.sleep(logout_wait)
 
-    time.sleep(1)
+        session.login(username, password, double_stack = double_stack)
 
-    for i in range(attempt):
         time.sleep(attempt_interval)
-        state = session.get_state()
-        if state['error'] == 'ok':
-            return True
+
+        for i in range(attempt):
+            time.sleep(attempt_interval)
+            state = session.get_state()
+            if state.get('error') == 'ok':
+                return True
+    except SrAuthException as e:
+        print(f"Gateway answer error: {e.message}")
+    except requests.RequestException as e:
+        print(f"Gateway request failed: {e}")
+    finally:
+        session.http.close()
     
     return False
 
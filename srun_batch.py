@@ -0,0 +1,220 @@
+"""Bulk SRUN state, login and logout for many accounts
+
+Accounts are read from CSV with header username,password[,ip][,gw_server] or a JSON
+list of objects with the same keys. Results are written as JSON lines as soon as each
+account finishes.
+
+    python srun_batch.py --action login accounts.csv
+"""
+
+import contextlib
+import csv
+import json
+import socket
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, TextIO
+
+import requests
+
+from network_detect import AddressFamilyAdapter
+from srun_auth import SrAuthException, SrAuthSession
+
+class BatchAccount(NamedTuple):
+    username: str
+    password: str | None = None
+    ip: str | None = None # IP to authenticate. Default address seen by the gateway
+    gw_server: str | None = None # Default --gw-server
+
+class RateLimiter:
+    """Token bucket allowing {rate} requests per second with bursts of {burst}"""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+                self.last_time = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class RateLimitedSession(requests.Session):
+    """requests session sharing one connection pool and one rate limit per gateway"""
+    def __init__(self, limiter: RateLimiter, pool_size: int):
+        super().__init__()
+        self.limiter = limiter
+        adapter = AddressFamilyAdapter(socket.AF_INET, pool_connections=1, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, *args, **kwargs):
+        self.limiter.acquire()
+        return super().request(*args, **kwargs)
+
+def load_accounts(path: str) -> List[BatchAccount]:
+    with open(path, 'r', newline='') as f:
+        if path.endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    return [
+        BatchAccount(**{k: v for k, v in row.items() if k in BatchAccount._fields and v not in ('', None)})
+        for row in rows]
+
+def state_mismatch(account: BatchAccount, state: Dict[str, object]) -> str | None:
+    """Describe why {state} does not belong to {account}, None if it does"""
+    # Online answers carry online_ip, offline answers the client_ip the gateway looked up
+    answered_ip = state.get('online_ip') or state.get('client_ip')
+    if account.ip is not None and answered_ip != account.ip:
+        return f"Gateway answered for IP {answered_ip}, not {account.ip}. It may not support state queries for other IPs"
+
+    if state.get('error') != 'ok':
+        return None
+
+    # Gateways may report the user name without the domain suffix, e.g. @cmcc
+    user_name = str(state.get('user_name', ''))
+    if user_name.split('@')[0] != account.username.split('@')[0]:
+        return f"Gateway answered for user {user_name}, not {account.username}"
+
+    return None
+
+class BatchRunner:
+    def __init__(self,
+            gw_server: str,
+            n_type: int,
+            n: int,
+            ac_id: int,
+            protocol: str = 'https',
+            workers: int = 16,
+            rate: float = 20,
+            burst: int = 5,
+            attempts: int = 3,
+            output: TextIO = sys.stdout):
+        self.gw_server = gw_server
+        self.n_type = n_type
+        self.n = n
+        self.ac_id = ac_id
+        self.protocol = protocol
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.attempts = attempts
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.sessions: Dict[str, SrAuthSession] = {}
+        self.sessions_lock = threading.Lock()
+
+    def get_session(self, gw_server: str) -> SrAuthSession:
+        """One SrAuthSession, connection pool and rate limit per gateway"""
+        with self.sessions_lock:
+            if gw_server not in self.sessions:
+                http = RateLimitedSession(RateLimiter(self.rate, self.burst), self.workers)
+                self.sessions[gw_server] = SrAuthSession(
+                    gw_server, self.n_type, self.n, self.ac_id, protocol=self.protocol, http=http)
+            return self.sessions[gw_server]
+
+    def run_account(self, action: str, account: BatchAccount) -> Dict[str, object]:
+        session = self.get_session(account.gw_server or self.gw_server)
+        result: Dict[str, object] = {'username': account.username, 'ip': account.ip, 'action': action}
+        start = time.monotonic()
+
+        try:
+            if action == 'state':
+                state = session.get_state(account.ip)
+                result['result'] = state
+                # Gateways may ignore the ip parameter and answer with the session of the batch host
+                mismatch = state_mismatch(account, state)
+                if mismatch is not None:
+                    raise SrAuthException(mismatch)
+                result['ok'] = state.get('error') == 'ok'
+            elif action == 'login':
+                if account.password is None:
+                    raise SrAuthException("No password for login")
+                state = session.login(account.username, account.password, self.attempts, ip=account.ip)
+                result['ok'] = state.get('error') == 'ok'
+                result['result'] = state
+            else:
+                result['ok'] = session.logout(account.username, ip=account.ip)
+        except SrAuthException as e:
+            result['ok'] = False
+            result['error'] = e.message
+        except requests.RequestException as e:
+            result['ok'] = False
+            result['error'] = str(e)
+        except Exception as e: # One broken account must not end the batch
+            result['ok'] = False
+            result['error'] = f'{type(e).__name__}: {e}'
+
+        result['elapsed_sec'] = time.monotonic() - start
+        self.emit(result)
+        return result
+
+    def emit(self, result: Dict[str, object]) -> None:
+        line = json.dumps(result)
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def run(self, action: str, accounts: List[BatchAccount]) -> List[Dict[str, object]]:
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(lambda account: self.run_account(action, account), accounts))
+
+    def close(self) -> None:
+        for i in self.sessions.values():
+            i.http.close()
+
+if __name__ == '__main__':
+    parser = ArgumentParser("SRUN batch operations")
+    parser.add_argument('accounts', type=str, help='CSV or JSON file of accounts')
+    parser.add_argument('--action', '-a', type=str, choices=['state', 'login', 'logout'], default='state')
+    parser.add_argument('--gw-server', type=str, default='gw.buaa.edu.cn', help='Default SRUN gateway')
+    parser.add_argument('--protocol', type=str, choices=['https', 'http'], default='https')
+    parser.add_argument('--n-type', type=int, default=1, help='SRUN internal parameter')
+    parser.add_argument('--n', type=int, default=200, help='SRUN internal parameter')
+    parser.add_argument('--acid', type=int, default=68, help='SRUN internal parameter')
+    parser.add_argument('--workers', '-j', type=int, default=16, help='Concurrent accounts. Default 16')
+    parser.add_argument('--rate', type=float, default=20, help='Requests per second per gateway, 0 for unlimited. Default 20')
+    parser.add_argument('--burst', type=int, default=5, help='Request burst per gateway. Default 5')
+    parser.add_argument('--attempts', type=int, default=3, help='Login attempts per account. Default 3')
+
+    args = parser.parse_args(sys.argv[1:])
+    if args.attempts < 1:
+        parser.error('--attempts must be at least 1')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.burst < 1:
+        parser.error('--burst must be at least 1')
+
+    runner = BatchRunner(
+        args.gw_server, args.n_type, args.n, args.acid,
+        protocol=args.protocol,
+        workers=args.workers,
+        rate=args.rate,
+        burst=args.burst,
+        attempts=args.attempts,
+        output=sys.stdout)
+
+    # SrAuthSession logs to stdout, keep stdout for JSON lines
+    with contextlib.redirect_stdout(sys.stderr):
+        results = runner.run(args.action, load_accounts(args.accounts))
+    runner.close()
+
+    exit(0 if all(i['ok'] for i in results) else 1)
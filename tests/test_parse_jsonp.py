@@ -0,0 +1,45 @@
+import unittest
+
+from srun_auth import SrAuthException, parse_jsonp
+
+CALLBACK = 'jQuery112406118340540763985_1632200000000'
+
+class ParseJsonpTest(unittest.TestCase):
+    def test_plain_answer(self):
+        self.assertEqual(parse_jsonp(f'{CALLBACK}({{"error":"ok","online_ip":"10.0.0.1"}})', CALLBACK),
+                         {'error': 'ok', 'online_ip': '10.0.0.1'})
+
+    def test_parentheses_in_message(self):
+        # Gateway error messages contain ')' which used to cut the JSON short
+        answer = f'{CALLBACK}({{"error":"login_error","error_msg":"E2901: (Third party 1)bind_user2: ldap_bind error"}})'
+        self.assertEqual(parse_jsonp(answer, CALLBACK)['error_msg'], 'E2901: (Third party 1)bind_user2: ldap_bind error')
+
+    def test_trailing_semicolon_and_whitespace(self):
+        self.assertEqual(parse_jsonp(f'  {CALLBACK}({{"error":"ok"}});\r\n', CALLBACK), {'error': 'ok'})
+
+    def test_truncated_answer(self):
+        with self.assertRaises(SrAuthException):
+            parse_jsonp(f'{CALLBACK}({{"error":"ok","online_ip":"10.0', CALLBACK)
+
+    def test_wrong_callback(self):
+        with self.assertRaises(SrAuthException):
+            parse_jsonp('jQuery1_2({"error":"ok"})', CALLBACK)
+
+    def test_callback_prefix_of_other_name(self):
+        with self.assertRaises(SrAuthException):
+            parse_jsonp(f'{CALLBACK}0({{"error":"ok"}})', CALLBACK)
+
+    def test_invalid_json(self):
+        with self.assertRaises(SrAuthException):
+            parse_jsonp(f'{CALLBACK}({{error: ok}})', CALLBACK)
+
+    def test_not_an_object(self):
+        with self.assertRaises(SrAuthException):
+            parse_jsonp(f'{CALLBACK}(["ok"])', CALLBACK)
+
+    def test_html_error_page(self):
+        with self.assertRaises(SrAuthException):
+            parse_jsonp('<html><body>502 Bad Gateway</body></html>', CALLBACK)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import time
+import unittest
+
+from network_daemon import DaemonConfiguration, ProbeCadence
+
+# Defaults: base 60 s, min 5 s, max 300 s, window of 20 probes, back-off factor 2, 600 s recover watch
+CONFIG = DaemonConfiguration()
+START = 1_000_000.0
+
+def quiet_hour_config(config: DaemonConfiguration = CONFIG) -> DaemonConfiguration:
+    """{config} with no flaky hours, whatever the local time zone"""
+    return config._replace(flaky_hours = ())
+
+class ProbeCadenceTest(unittest.TestCase):
+    def run_healthy(self, cadence: ProbeCadence, config: DaemonConfiguration, start: float, end: float, latency_sec: float = 0.05) -> float:
+        """Probe successfully at the chosen interval from {start} until {end}. Returns the time of the next probe"""
+        now = start
+        while now < end:
+            cadence.record_probe(config, True, latency_sec, now)
+            interval, _ = cadence.next_interval(config, now, 0)
+            now += interval
+        return now
+
+    def test_base_interval_without_history(self):
+        cadence = ProbeCadence(CONFIG.check_history_size)
+        self.assertEqual(cadence.next_interval(quiet_hour_config(), START, 0), (60, 'base'))
+
+    def test_backoff_schedule(self):
+        config = quiet_hour_config()
+        cadence = ProbeCadence(config.check_history_size)
+        cadence.record_probe(config, True, 0.05, START)
+
+        # One window is 20 base intervals = 1200 s of healthy time
+        self.assertEqual(cadence.next_interval(config, START + 1199, 0), (60, 'base'))
+        self.assertEqual(cadence.next_interval(config, START + 1200, 0), (120, 'stable'))
+        self.assertEqual(cadence.next_interval(config, START + 2400, 0), (240, 'stable'))
+        self.assertEqual(cadence.next_interval(config, START + 3600, 0), (300, 'stable'))
+        self.assertEqual(cadence.next_interval(config, START + 10 ** 7, 0), (300, 'stable'))
+
+    def test_failure_resets_backoff(self):
+        config = quiet_hour_config()
+        cadence = ProbeCadence(config.check_history_size)
+        now = self.run_healthy(cadence, config, START, START + 5000)
+        self.assertEqual(cadence.next_interval(config, now, 0), (300, 'stable'))
+
+        cadence.record_probe(config, False, 2, now)
+        cadence.record_probe(config, True, 0.05, now + 1)
+        self.assertEqual(cadence.next_interval(config, now + 1, 0), (60, 'base'))
+
+    def test_tight_after_recovery(self):
+        config = quiet_hour_config()
+        cadence = ProbeCadence(config.check_history_size)
+        self.run_healthy(cadence, config, START, START + 5000)
+        recovered = START + 5000
+
+        self.assertEqual(cadence.next_interval(config, recovered + 1, recovered), (5, 'recent recovery'))
+        self.assertEqual(cadence.next_interval(config, recovered + 599, recovered), (5, 'recent recovery'))
+        # Stability counts from the recovery, not from the probes before it
+        self.assertEqual(cadence.next_interval(config, recovered + 600, recovered), (60, 'base'))
+
+    def test_tight_checks_do_not_speed_up_backoff(self):
+        config = quiet_hour_config()
+        cadence = ProbeCadence(config.check_history_size)
+        # 120 probes 5 s apart after a recovery are six windows of probes but only 600 s of healthy time
+        for i in range(120):
+            cadence.record_probe(config, True, 0.05, START + i * 5)
+        self.assertEqual(cadence.next_interval(config, START + 600, START), (60, 'base'))
+
+    def test_tight_in_flaky_hour(self):
+        hour = time.localtime(START).tm_hour
+        cadence = ProbeCadence(CONFIG.check_history_size)
+        config = CONFIG._replace(flaky_hours = (hour,))
+        self.run_healthy(cadence, quiet_hour_config(), START - 5000, START)
+
+        self.assertEqual(cadence.next_interval(config, START, 0), (5, 'flaky hour'))
+        self.assertEqual(cadence.next_interval(config._replace(flaky_hours = ((hour + 1) % 24,)), START, 0)[1], 'stable')
+
+    def test_tight_when_latency_trends_up(self):
+        config = quiet_hour_config()
+        cadence = ProbeCadence(config.check_history_size)
+        for i in range(10):
+            cadence.record_probe(config, True, 0.05, START + i)
+        for i in range(10):
+            cadence.record_probe(config, True, 0.5, START + 10 + i)
+
+        self.assertEqual(cadence.next_interval(config, START + 20, 0), (5, 'latency trending up'))
+
+    def test_latency_jitter_is_not_a_trend(self):
+        config = quiet_hour_config()
+        cadence = ProbeCadence(config.check_history_size)
+        for i in range(10):
+            cadence.record_probe(config, True, 0.01, START + i)
+        for i in range(10):
+            cadence.record_probe(config, True, 0.03, START + 10 + i)
+
+        self.assertEqual(cadence.next_interval(config, START + 20, 0), (60, 'base'))
+
+    def test_latency_trend_needs_enough_samples(self):
+        config = quiet_hour_config()
+        cadence = ProbeCadence(config.check_history_size)
+        for i, latency in enumerate([0.05, 0.05, 0.05, 1, 1, 1]):
+            cadence.record_probe(config, True, latency, START + i)
+
+        self.assertFalse(cadence.latency_trending_up(config))
+
+    def test_history_resize_keeps_newest(self):
+        config = quiet_hour_config()
+        cadence = ProbeCadence(config.check_history_size)
+        for i in range(20):
+            cadence.record_probe(config, True, 0.05, START + i)
+        self.assertEqual(len(cadence.history), 20)
+
+        small = config._replace(check_history_size = 5)
+        cadence.record_probe(small, True, 0.05, START + 20)
+        self.assertEqual(cadence.history.maxlen, 5)
+        self.assertEqual([i.time for i in cadence.history], [START + i for i in range(16, 21)])
+
+        # Sizes below 1 are clamped instead of making deque drop every probe
+        cadence.record_probe(config._replace(check_history_size = 0), True, 0.05, START + 21)
+        self.assertEqual(len(cadence.history), 1)
+
+    def test_fixed_interval_when_disabled(self):
+        config = quiet_hour_config(CONFIG._replace(adaptive_check_interval = False))
+        cadence = ProbeCadence(config.check_history_size)
+        self.assertEqual(cadence.next_interval(config, START, START - 1), (60, 'fixed'))
+
+    def test_tight_never_above_base(self):
+        config = quiet_hour_config(CONFIG._replace(check_interval_sec = 2))
+        cadence = ProbeCadence(config.check_history_size)
+        self.assertEqual(cadence.next_interval(config, START, START - 1), (2, 'recent recovery'))
+
+if __name__ == '__main__':
+    unittest.main()
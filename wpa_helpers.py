@@ -1,3 +1,5 @@
+import ipaddress
+import itertools
 import socket
 import time
 import re
@@ -6,19 +8,23 @@ from typing import Dict, List, Tuple, ContextManager
 import netifaces as ni
 import subprocess as sp
 
+socket_counter = itertools.count()
+
 class WPASupplicantControllerSocket:
     def __init__(self, ctrl_path: str):
         self.socket_remote = ctrl_path
-        self.socket_local = f'/tmp/wpa-{str(int(time.time()%10000))}'
-
-        if os.path.exists(self.socket_local):
-            os.remove(self.socket_local)
+        # Abstract namespace address, unique per process and socket. Nothing is left in
+        # the filesystem when the socket is closed or the process dies
+        self.socket_local = f'\0bnaod-wpa-{os.getpid()}-{next(socket_counter)}'
 
         self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
-        self.sock.bind(self.socket_local)
-        self.sock.connect(self.socket_remote)
-        self.sock.settimeout(0.2)
-        pass
+        try:
+            self.sock.bind(self.socket_local)
+            self.sock.connect(self.socket_remote)
+            self.sock.settimeout(0.2)
+        except OSError:
+            self.sock.close()
+            raise
 
     def send_and_recv(self, cmd: str) -> str:
         self.sock.sendto(str.encode(cmd), self.socket_remote)
@@ -38,7 +44,6 @@ class WPASupplicantControllerSocket:
     
     def close(self):
         self.sock.close()
-        os.remove(self.socket_local)
 
 class WPASupplicantException(Exception):
     def __init__(self, message: str):
@@ -50,6 +55,7 @@ class WPASupplicantController(ContextManager):
         self.sock = WPASupplicantControllerSocket(ctrl_path)
 
         if self.sock.send_and_recv('ATTACH') != 'OK\n':
+            self.sock.close()
             raise WPASupplicantException("Unable to attach")
 
     def list_networks(self):
@@ -107,8 +113,8 @@ class WPASupplicantController(ContextManager):
 
     def close(self):
         self.sock.close()
-    def __entry__(self):
-        pass
+    def __enter__(self):
+        return self
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
     
@@ -120,7 +126,25 @@ def allocate_network(supp: WPASupplicantController, ssid: str) -> int:
     
     return supp.new_network()
 
-def wpa_recover_open(ctrl_if: str, if_name:str, ssid: str, attempts: int = 20, timeout: float = 1) -> bool:
+def is_network_configured(supp: WPASupplicantController, id: int | None, ssid: str) -> bool:
+    if id is None:
+        return False
+
+    return any(i[0] == id and i[1] == ssid for i in supp.list_networks())
+
+def wpa_recover_open(
+        ctrl_if: str,
+        if_name:str,
+        ssid: str,
+        attempts: int = 20,
+        timeout: float = 1,
+        network_id: int | None = None,
+        dhcp_renew: bool = True) -> Tuple[bool, int | None]:
+    """Re-establish link to open network {ssid}.
+
+    {network_id} is the network configured by a previous call. If it still exists,
+    the network is reused without rewriting wpa_supplicant configuration.
+    Returns success flag and the network id in use."""
     with WPASupplicantController(os.path.join(ctrl_if, if_name)) as supp:
         status = supp.get_status()
         if 'wpa_state' in status:
@@ -128,15 +152,18 @@ def wpa_recover_open(ctrl_if: str, if_name:str, ssid: str, attempts: int = 20, t
                 print(f"Interface {if_name} disabled. Try start")
 
                 sp.run(['ip', 'link', 'set', if_name, 'up'])
-        
-        time.sleep(5)
-        status = supp.get_status()
-        if status['wpa_state'] == 'INTERFACE_DISABLED':
-            print(f"Interface {if_name} still disabled. Failed")
-            return False
 
-        network = allocate_network(supp, ssid)
-        supp.config_open_network(network, ssid)
+                time.sleep(5)
+                status = supp.get_status()
+                if status['wpa_state'] == 'INTERFACE_DISABLED':
+                    print(f"Interface {if_name} still disabled. Failed")
+                    return False, network_id
+
+        if is_network_configured(supp, network_id, ssid):
+            network = network_id
+        else:
+            network = allocate_network(supp, ssid)
+            supp.config_open_network(network, ssid)
 
         supp.enable_network(network)
         supp.select_network(network)
@@ -151,10 +178,13 @@ def wpa_recover_open(ctrl_if: str, if_name:str, ssid: str, attempts: int = 20, t
             time.sleep(timeout)
 
         if not connect_success:
-            return False
+            return False, network
         
         print("Connect successful")
 
+        if not dhcp_renew:
+            return True, network
+
         if socket.AF_INET in ni.ifaddresses(if_name):
             print("Clear DHCP Address and reassign")
             sp.run(['/sbin/dhclient','-r',if_name])
@@ -167,13 +197,20 @@ def wpa_recover_open(ctrl_if: str, if_name:str, ssid: str, attempts: int = 20, t
         if socket.AF_INET in ni.ifaddresses(if_name):
             print("Address reassign success")
 
-        return True
+        return True, network
     pass
 
-def get_local_ip(if_name:str) -> str:
-    address_info = ni.ifaddresses(if_name)
-    if socket.AF_INET in ni.ifaddresses(if_name):
-        return address_info[socket.AF_INET][0]['addr']
+def get_local_ip(if_name:str, family: socket.AddressFamily = socket.AF_INET) -> str:
+    try:
+        address_info = ni.ifaddresses(if_name)
+    except ValueError as _: # No such interface
+        return '<None>'
+
+    for i in address_info.get(family, []):
+        # Only global IPv6 addresses are reachable from outside. Skip link-local and ULA
+        if family == socket.AF_INET6 and not ipaddress.ip_address(i['addr'].split('%')[0]).is_global:
+            continue
+        return i['addr']
     return '<None>'
 
 if __name__=="__main__":